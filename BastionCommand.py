@@ -4,6 +4,8 @@ import requests
 import time
 import json
 import random
+import os
+import logging
 from supabase import create_client, Client
 
 # --- CONFIGURATION & INITIALIZATION ---
@@ -15,101 +17,35 @@ st.set_page_config(
 )
 
 # --- AESTHETICS & CUSTOM CSS ---
-def load_css():
-    """Injects custom CSS for a D&D-inspired aesthetic."""
-    st.markdown("""
-    <style>
-        @import url('https://fonts.googleapis.com/css2?family=IM+Fell+English+SC&family=Libre+Baskerville:ital@0;1&display=swap');
-
-        /* Main app styling */
-        .stApp {
-            background-image: url("https://www.transparenttextures.com/patterns/crissxcross.png");
-            background-color: #2E2A24; /* A dark, parchment-like brown */
-        }
-
-        /* Main content area */
-        .main .block-container {
-            padding-top: 2rem;
-            padding-bottom: 2rem;
-            padding-left: 5rem;
-            padding-right: 5rem;
-        }
-
-        /* Sidebar styling */
-        .stSidebar {
-            background-color: #1a1814;
-        }
-
-        /* Font styles */
-        h1, h2, h3, h4, h5, h6 {
-            font-family: 'IM Fell English SC', serif;
-            color: #D4AF37; /* Gold color for headers */
-        }
-        .stMarkdown, p, .stButton > button, .stSelectbox > div > div, .stTextInput > div > div > input {
-            font-family: 'Libre Baskerville', serif;
-            color: #EAE0C8; /* Cream/parchment color for text */
-        }
-
-        /* Custom container style for a "scroll" or "tablet" effect */
-        .st-emotion-cache-1r6slb0, .bastion-card {
-            border: 2px solid #5a4d39;
-            background-color: #3c352a;
-            border-radius: 10px;
-            padding: 20px;
-            box-shadow: 0 4px 8px 0 rgba(0,0,0,0.5);
-            margin-bottom: 20px;
-        }
+# The theme lives in static/theme.css. Its fonts and background texture are served by
+# Streamlit's static file serving (see .streamlit/config.toml), so the app needs no
+# third-party hosts. Bump THEME_VERSION whenever a file under static/ changes so
+# browsers drop their cached copies of the assets.
+THEME_VERSION = "1"
+THEME_CSS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static", "theme.css")
+THEME_FONT_FILES = ["IMFellEnglishSC-Regular.woff2", "LibreBaskerville-Regular.woff2", "LibreBaskerville-Italic.woff2"]
 
-        /* Button styling */
-        .stButton > button {
-            border: 2px solid #D4AF37;
-            background-color: transparent;
-            color: #D4AF37;
-            padding: 10px 24px;
-            border-radius: 8px;
-            transition: all 0.3s ease-in-out;
-        }
-        .stButton > button:hover {
-            background-color: #D4AF37;
-            color: #1a1814;
-            border-color: #D4AF37;
-        }
-        .stButton > button:active {
-            background-color: #b89a31 !important;
-            color: #1a1814 !important;
-        }
-        
-        /* Disabled button styling */
-        .stButton > button:disabled {
-            border-color: #5a4d39;
-            color: #5a4d39;
-            background-color: #3c352a;
-        }
+@st.cache_resource
+def get_theme_markup():
+    """Reads the theme stylesheet once per server process and wraps it for injection."""
+    with open(THEME_CSS_PATH, encoding="utf-8") as f:
+        css = f.read().replace("__THEME_VERSION__", THEME_VERSION)
+    return f"<style>\n{css}</style>"
 
-        /* Metric styling */
-        .st-emotion-cache-1g8m52x {
-            background-color: #3c352a;
-            border: 1px solid #5a4d39;
-            border-radius: 8px;
-            padding: 1rem;
-        }
-        .st-emotion-cache-1g8m52x p {
-            font-family: 'IM Fell English SC', serif;
-        }
-        
-        /* Mortimer's Log Styling */
-        .log-entry {
-            border-left: 3px solid #5a4d39; /* Default border color */
-            padding-left: 10px;
-            margin-bottom: 8px;
-        }
-        .log-entry-negative { border-left-color: #FF5733; }
-        .log-entry-positive { border-left-color: #D4AF37; }
-        .log-entry-progress { border-left-color: #F7DC6F; }
-        .log-entry-complete { border-left-color: #82E0AA; }
+@st.cache_resource
+def check_theme_fonts():
+    """Warns once per server process about bundled theme fonts missing from static/fonts."""
+    fonts_dir = os.path.join(os.path.dirname(THEME_CSS_PATH), "fonts")
+    missing_fonts = [name for name in THEME_FONT_FILES if not os.path.exists(os.path.join(fonts_dir, name))]
+    if missing_fonts:
+        logging.warning("Theme fonts missing from static/fonts (see README.md there): %s", ", ".join(missing_fonts))
 
-    </style>
-    """, unsafe_allow_html=True)
+def load_css():
+    """Injects custom CSS for a D&D-inspired aesthetic."""
+    # Streamlit drops elements a rerun doesn't re-emit, so the cached markup is sent each
+    # run; the fonts and texture it references are fetched once and then browser-cached.
+    check_theme_fonts()
+    st.markdown(get_theme_markup(), unsafe_allow_html=True)
 
 load_css()
 
@@ -229,16 +165,101 @@ def load_data(campaign_id=1):
             }
             bastions.append(bastion)
 
-        return {
+        data = {
             "campaign": campaign,
             "characters": characters,
             "bastions": bastions,
             "log": [f"Day {l['day_occurred']}: {l['entry_text']}" for l in log]
         }
+        data['summary'] = build_campaign_summary(data)
+        return data
     except Exception as e:
         st.error(f"An error occurred while fetching data from Supabase: {e}")
         return None
 
+# --- CAMPAIGN SUMMARY ---
+# Aggregates and id-keyed indexes for the dashboards. Built once per load and then
+# kept current by the write paths below, so the views never rescan every bastion.
+def is_facility_active(facility):
+    """Returns True if the facility is busy with an order, construction or enlargement."""
+    return facility.get('status', 'Idle') != 'Idle'
+
+def build_campaign_summary(data):
+    """Builds the campaign aggregates and lookup indexes from freshly loaded data."""
+    summary = {
+        "total_defenders": 0,
+        "total_facilities": 0,
+        "active_facilities": 0,
+        "characters_by_id": {c['id']: c for c in data['characters']},
+        "bastions_by_id": {},
+        "bastions_by_character_id": {},
+        # Facility name (e.g. "Bedroom") -> {"active_days", "total_days"}, pooled across
+        # every bastion. The per-facility day counters are stored in Supabase.
+        "facility_utilization": {},
+    }
+    for bastion in data['bastions']:
+        summary['bastions_by_id'][bastion['id']] = bastion
+        summary['bastions_by_character_id'].setdefault(bastion['character_id'], bastion)
+        summary['total_defenders'] += bastion['defenders']
+        for facility in bastion['facilities']:
+            summary['total_facilities'] += 1
+            if is_facility_active(facility):
+                summary['active_facilities'] += 1
+            if facility.get('total_days'):
+                add_facility_days(summary, facility['name'], facility.get('active_days') or 0, facility['total_days'])
+    return summary
+
+def get_bastion_owner(summary, bastion):
+    """Returns the character owning a bastion, or None if they are not in this campaign."""
+    return summary['characters_by_id'].get(bastion['character_id'])
+
+def set_bastion_defenders(summary, bastion, defenders):
+    """Sets a bastion's defender count and adjusts the campaign total."""
+    summary['total_defenders'] += defenders - bastion['defenders']
+    bastion['defenders'] = defenders
+
+def add_facility(summary, bastion, facility):
+    """Adds a newly inserted facility record to its bastion and the campaign totals."""
+    bastion['facilities'].append(facility)
+    summary['total_facilities'] += 1
+    if is_facility_active(facility):
+        summary['active_facilities'] += 1
+
+def update_facility(summary, facility, update_payload):
+    """Applies an update to a facility record, keeping the active facility count in step."""
+    was_active = is_facility_active(facility)
+    facility.update(update_payload)
+    summary['active_facilities'] += int(is_facility_active(facility)) - int(was_active)
+
+def add_facility_days(summary, facility_name, active_days, total_days):
+    """Adds elapsed days to the utilization totals for every facility with this name."""
+    usage = summary['facility_utilization'].setdefault(facility_name, {"active_days": 0, "total_days": 0})
+    usage['active_days'] += active_days
+    usage['total_days'] += total_days
+
+def record_facility_day(summary, facility):
+    """Tallies one elapsed day on the facility record and its name's totals, counting it as active if busy."""
+    active = int(is_facility_active(facility))
+    facility['active_days'] = (facility.get('active_days') or 0) + active
+    facility['total_days'] = (facility.get('total_days') or 0) + 1
+    add_facility_days(summary, facility['name'], active, 1)
+
+def save_facility_utilization(data):
+    """Writes every facility's utilization counters to Supabase in a single upsert."""
+    # Whole records are sent so the upsert never trips NOT NULL columns; they match what
+    # the time advance has just written. See supabase/migrations for the counter columns.
+    rows = [facility for bastion in data['bastions'] for facility in bastion['facilities']]
+    if not rows: return
+    try:
+        supabase.table("facilities").upsert(rows).execute()
+    except Exception as e:
+        st.warning(f"Could not save facility utilization to database: {e}")
+
+def get_productivity(summary):
+    """Returns the percentage of facilities currently busy."""
+    total = summary['total_facilities']
+    return (summary['active_facilities'] / total * 100) if total > 0 else 0
+
 # --- HELPER FUNCTIONS ---
 def send_to_discord(message):
     """Formats and sends a message to a Discord webhook."""
@@ -306,8 +327,9 @@ def proprietor_view(data):
         st.warning(f"As a level {character['level']} adventurer, you have not yet earned the right to a Bastion. Return when you have attained the 5th level of experience.")
         return
 
-    # Find the specific bastion object from the session state to modify it directly
-    bastion_index, bastion = next(((i, b) for i, b in enumerate(data['bastions']) if b['character_id'] == character['id']), (None, None))
+    # The summary indexes the session state's own bastion objects, so they can be modified directly
+    summary = data['summary']
+    bastion = summary['bastions_by_character_id'].get(character['id'])
     if not bastion:
         st.error(f"No bastion found for {char_name}. Please ensure one is created in the Supabase table.")
         return
@@ -330,21 +352,17 @@ def proprietor_view(data):
             message += f" The bastion was attacked! It lost {losses} defenders. (Rolls: {dice_rolls})"
             # Update DB and session state
             supabase.table("bastions").update({"defenders": new_defenders}).eq("id", bastion['id']).execute()
-            st.session_state.data['bastions'][bastion_index]['defenders'] = new_defenders
+            set_bastion_defenders(summary, bastion, new_defenders)
             
         st.success(f"Maintain order issued. Rolled {roll}: {event_name}!")
         add_log_entry(data['campaign']['current_day'], message)
         time.sleep(1)
         st.rerun() # Rerun with updated session state
 
-    for fac_index, facility in enumerate(sorted(bastion['facilities'], key=lambda f: (f['type'], f['name']))):
-        # Find the original index to update the session state correctly
-        original_fac_index = next((i for i, f in enumerate(st.session_state.data['bastions'][bastion_index]['facilities']) if f['id'] == facility['id']), None)
-        if original_fac_index is None: continue
-
+    for facility in sorted(bastion['facilities'], key=lambda f: (f['type'], f['name'])):
         with st.container():
             cols = st.columns([2, 2, 1])
-            is_busy = facility.get('status', 'Idle') != 'Idle'
+            is_busy = is_facility_active(facility)
             
             with cols[0]:
                 st.markdown(f"**{facility['name']}** ({facility['type']})")
@@ -363,7 +381,7 @@ def proprietor_view(data):
                         update_payload = {"status": "Idle", "order_progress": 0, "order_duration": 0}
                         supabase.table("facilities").update(update_payload).eq("id", facility['id']).execute()
                         add_log_entry(data['campaign']['current_day'], f"{char_name} cancelled the order '{facility['status']}' at the {facility['name']}.")
-                        st.session_state.data['bastions'][bastion_index]['facilities'][original_fac_index].update(update_payload)
+                        update_facility(summary, facility, update_payload)
                         st.rerun()
                 else: # Facility is Idle
                     if facility['type'] == 'Basic':
@@ -394,7 +412,7 @@ def proprietor_view(data):
                         update_payload = {"status": order_choice, "order_progress": 0, "order_duration": order_details['duration']}
                         supabase.table("facilities").update(update_payload).eq("id", facility['id']).execute()
                         add_log_entry(data['campaign']['current_day'], f"{char_name}'s {facility['name']} began the order: {order_choice}.")
-                        st.session_state.data['bastions'][bastion_index]['facilities'][original_fac_index].update(update_payload)
+                        update_facility(summary, facility, update_payload)
                         del st.session_state.selected_facility_order
                         st.rerun()
                             
@@ -411,7 +429,7 @@ def proprietor_view(data):
                         update_payload = {"status": f"Enlarging to {target_size}", "order_progress": 0, "order_duration": cost_info['time_days']}
                         supabase.table("facilities").update(update_payload).eq("id", facility['id']).execute()
                         add_log_entry(data['campaign']['current_day'], f"{char_name} has begun enlarging their {facility['name']} to {target_size}.")
-                        st.session_state.data['bastions'][bastion_index]['facilities'][original_fac_index].update(update_payload)
+                        update_facility(summary, facility, update_payload)
                         del st.session_state.selected_facility_upgrade
                         st.rerun()
 
@@ -447,7 +465,7 @@ def proprietor_view(data):
                     
                     add_log_entry(data['campaign']['current_day'], f"{char_name} has acquired a new facility: {new_special}!")
                     st.success(f"{new_special} has been added to your bastion!")
-                    st.session_state.data['bastions'][bastion_index]['facilities'].append(new_facility_record)
+                    add_facility(summary, bastion, new_facility_record)
                     time.sleep(1)
                     st.rerun()
 
@@ -467,7 +485,7 @@ def proprietor_view(data):
 
             add_log_entry(data['campaign']['current_day'], f"{char_name} has begun construction on a new {new_basic_name} ({new_basic_size}).")
             st.success(f"Construction order for {new_basic_name} has been issued!")
-            st.session_state.data['bastions'][bastion_index]['facilities'].append(new_facility_record)
+            add_facility(summary, bastion, new_facility_record)
             time.sleep(1)
             st.rerun()
 
@@ -481,10 +499,9 @@ def communal_view(data):
     st.title("🏰 The Bastion's Hearth")
     st.markdown("---")
     
-    total_defenders = sum(b['defenders'] for b in data['bastions'])
-    total_facilities = sum(len(b['facilities']) for b in data['bastions'])
-    active_facilities = sum(1 for b in data['bastions'] for f in b['facilities'] if f.get('status', 'Idle') != 'Idle')
-    productivity = (active_facilities / total_facilities * 100) if total_facilities > 0 else 0
+    summary = data['summary']
+    total_defenders = summary['total_defenders']
+    productivity = get_productivity(summary)
     threat_level = data['campaign'].get('threat_level', 'Peaceful')
 
     col1, col2, col3, col4, col5 = st.columns(5)
@@ -505,7 +522,7 @@ def communal_view(data):
         for i, bastion in enumerate(data['bastions']):
             with cols[i % min(num_bastions, 4)]:
                 with st.container():
-                    owner = next((c for c in data['characters'] if c['id'] == bastion['character_id']), None)
+                    owner = get_bastion_owner(summary, bastion)
                     st.markdown(f"""
                     <div class="bastion-card">
                         <h4>{bastion['name']}</h4>
@@ -514,6 +531,16 @@ def communal_view(data):
                     </div>
                     """, unsafe_allow_html=True)
 
+    if summary['facility_utilization']:
+        st.markdown("---")
+        st.subheader("Facility Utilization")
+        utilization = pd.DataFrame([
+            {"Facility": name, "Active Days": usage['active_days'], "Total Days": usage['total_days'],
+             "Utilization": f"{usage['active_days'] / usage['total_days'] * 100:.0f}%"}
+            for name, usage in sorted(summary['facility_utilization'].items())
+        ])
+        st.dataframe(utilization, hide_index=True, use_container_width=True)
+
     st.markdown("---")
     st.subheader("Mortimer's Log")
     log_container = st.container(height=300)
@@ -529,14 +556,15 @@ def dm_view(data):
     st.title("👑 The Architect's Sanctum")
     st.markdown("---")
     
+    summary = data['summary']
     st.header("Master Control Panel")
     with st.expander("View All Bastion Details"):
         for bastion in data['bastions']:
-            owner = next((c for c in data['characters'] if c['id'] == bastion['character_id']), None)
+            owner = get_bastion_owner(summary, bastion)
             st.subheader(f"{bastion['name']} (Proprietor: {owner['name'] if owner else 'N/A'})")
             st.text(f"Defenders: {bastion['defenders']}")
             
-            active_orders = [f for f in bastion['facilities'] if f.get('status', 'Idle') != 'Idle']
+            active_orders = [f for f in bastion['facilities'] if is_facility_active(f)]
             if not active_orders:
                 st.text("All facilities are idle.")
             else:
@@ -557,13 +585,14 @@ def dm_view(data):
             with st.spinner(f"Advancing time by {days_to_advance} days..."):
                 for day_offset in range(1, days_to_advance + 1):
                     day_in_progress = current_day + day_offset
-                    for bastion_index, bastion in enumerate(data['bastions']):
-                        for fac_index, facility in enumerate(bastion['facilities']):
-                            if facility.get('status', 'Idle') == 'Idle': continue
+                    for bastion in data['bastions']:
+                        owner = get_bastion_owner(summary, bastion)
+                        for facility in bastion['facilities']:
+                            record_facility_day(summary, facility)
+                            if not is_facility_active(facility): continue
                             new_progress = facility['order_progress'] + 1
                             if new_progress >= facility['order_duration']:
                                 completed_order = facility['status']
-                                owner = next(c for c in data['characters'] if c['id'] == bastion['character_id'])
                                 update_payload = {"status": "Idle", "order_progress": 0, "order_duration": 0}
                                 log_message = ""
                                 if completed_order.startswith("Enlarging to "):
@@ -576,13 +605,14 @@ def dm_view(data):
                                     log_message = f"{owner['name']}'s {facility['name']} has completed the order: {completed_order}."
                                 supabase.table("facilities").update(update_payload).eq("id", facility['id']).execute()
                                 add_log_entry(day_in_progress, log_message)
-                                st.session_state.data['bastions'][bastion_index]['facilities'][fac_index].update(update_payload)
+                                update_facility(summary, facility, update_payload)
                             else:
                                 supabase.table("facilities").update({"order_progress": new_progress}).eq("id", facility['id']).execute()
-                                st.session_state.data['bastions'][bastion_index]['facilities'][fac_index]['order_progress'] = new_progress
+                                facility['order_progress'] = new_progress
                 new_day = current_day + days_to_advance
                 supabase.table("campaigns").update({"current_day": new_day}).eq("id", campaign['id']).execute()
                 st.session_state.data['campaign']['current_day'] = new_day
+                save_facility_utilization(data)
             st.success(f"Time advanced by {days_to_advance} days. New day is {new_day}.")
             time.sleep(1) 
             st.cache_data.clear()
@@ -610,14 +640,14 @@ def dm_view(data):
         st.rerun()
 
     st.subheader("Inject Bastion Event")
-    bastion_names = {b['id']: b['name'] for b in data['bastions']}
-    if bastion_names: # Only show if there are bastions to target
-        target_bastion_id = st.selectbox("Target Bastion:", options=list(bastion_names.keys()), format_func=lambda x: bastion_names[x])
+    bastions_by_id = summary['bastions_by_id']
+    if bastions_by_id: # Only show if there are bastions to target
+        target_bastion_id = st.selectbox("Target Bastion:", options=list(bastions_by_id.keys()), format_func=lambda x: bastions_by_id[x]['name'])
         event_to_inject = st.selectbox("Event to Trigger:", options=[name for r, name in BASTION_EVENTS.items()])
         if st.button("Trigger Event"):
-            message = f"A special event occurred at {bastion_names[target_bastion_id]}: **{event_to_inject}**."
+            message = f"A special event occurred at {bastions_by_id[target_bastion_id]['name']}: **{event_to_inject}**."
             add_log_entry(current_day, message)
-            st.success(f"Injected '{event_to_inject}' event for {bastion_names[target_bastion_id]}.")
+            st.success(f"Injected '{event_to_inject}' event for {bastions_by_id[target_bastion_id]['name']}.")
             time.sleep(1)
             st.rerun()
 
@@ -0,0 +1,6 @@
+-- Per-facility utilization counters, advanced by the DM's "Advance Time" action and
+-- pooled by facility name on the communal dashboard. Run this against existing
+-- databases; until it is applied, time advances but utilization is not saved.
+alter table facilities
+    add column if not exists active_days integer not null default 0,
+    add column if not exists total_days integer not null default 0;